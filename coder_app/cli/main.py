@@ -4,14 +4,21 @@ Provides persistent, local project management capabilities.
 """
 
 import click
+import itertools
 import os
-import json
+import orjson
+from datetime import datetime
 from typing import Optional
-import pandas as pd
 
 from ..services.project_manager import project_manager
 from ..models.survey_models import Codebook, Code
 
+# Columns read from codebook CSV files
+CODEBOOK_CSV_COLUMNS = ['code', 'description', 'examples']
+
+# Spaces in code names become dashes in VS Code snippet keys
+_SNIPPET_KEY_TABLE = str.maketrans(' ', '-')
+
 
 @click.group()
 @click.version_option()
@@ -49,23 +56,25 @@ def init(name: str, description: str, question: str, column: str):
         raise click.Abort()
 
 
-@project.command()
-def list():
+@project.command(name='list')
+def list_projects():
     """List all projects."""
     projects = project_manager.list_projects()
     if not projects:
         click.echo("No projects found. Create one with 'coder project init'.")
         return
     
-    click.echo(f"\n📂 Found {len(projects)} project(s):\n")
+    # Collect the whole listing and write it once
+    lines = [f"\n📂 Found {len(projects)} project(s):\n"]
     for p in projects:
-        click.echo(f"  • {p.name}")
+        lines.append(f"  • {p.name}")
         if p.description:
-            click.echo(f"    📝 {p.description}")
+            lines.append(f"    📝 {p.description}")
         if p.question_text:
-            click.echo(f"    ❓ {p.question_text}")
-        click.echo(f"    📅 Modified: {p.last_modified}")
-        click.echo()
+            lines.append(f"    ❓ {p.question_text}")
+        lines.append(f"    📅 Modified: {p.last_modified}")
+        lines.append("")
+    click.echo("\n".join(lines))
 
 
 @project.command()
@@ -77,30 +86,35 @@ def show(name: str):
         click.echo(f"❌ Project '{name}' not found", err=True)
         raise click.Abort()
     
-    click.echo(f"\n📂 Project: {project_meta.name}")
-    click.echo(f"📝 Description: {project_meta.description or 'None'}")
-    click.echo(f"❓ Question: {project_meta.question_text or 'None'}")
-    click.echo(f"📊 Column: {project_meta.column_to_code or 'None'}")
-    click.echo(f"📅 Created: {project_meta.created_at}")
-    click.echo(f"🕐 Modified: {project_meta.last_modified}")
+    # Collect the whole report and write it once
+    lines = [
+        f"\n📂 Project: {project_meta.name}",
+        f"📝 Description: {project_meta.description or 'None'}",
+        f"❓ Question: {project_meta.question_text or 'None'}",
+        f"📊 Column: {project_meta.column_to_code or 'None'}",
+        f"📅 Created: {project_meta.created_at}",
+        f"🕐 Modified: {project_meta.last_modified}"
+    ]
     
     # Show codebook info
     codebook = project_manager.get_latest_codebook(name)
     if codebook:
-        click.echo(f"\n📚 Codebook: {len(codebook.codes)} codes")
+        lines.append(f"\n📚 Codebook: {len(codebook.codes)} codes")
         for i, code in enumerate(codebook.codes[:5]):  # Show first 5
-            click.echo(f"  {i+1}. {code.code}: {code.description}")
+            lines.append(f"  {i+1}. {code.code}: {code.description}")
         if len(codebook.codes) > 5:
-            click.echo(f"  ... and {len(codebook.codes) - 5} more")
+            lines.append(f"  ... and {len(codebook.codes) - 5} more")
     else:
-        click.echo(f"\n📚 Codebook: Not created yet")
+        lines.append(f"\n📚 Codebook: Not created yet")
     
     # Show results info
     results_df = project_manager.get_project_results(name)
     if not results_df.empty:
-        click.echo(f"\n📊 Results: {len(results_df)} classifications")
+        lines.append(f"\n📊 Results: {len(results_df)} classifications")
     else:
-        click.echo(f"\n📊 Results: No classifications yet")
+        lines.append(f"\n📊 Results: No classifications yet")
+    
+    click.echo("\n".join(lines))
 
 
 @project.command()
@@ -116,26 +130,32 @@ def delete(name: str):
 
 @project.command()
 @click.option('--name', '-n', required=True, help='Project name')
-@click.option('--file', '-f', required=True, type=click.Path(exists=True), help='Data file (CSV or Excel)')
+@click.option('--file', '-f', required=True, type=click.Path(exists=True), help='Data file (CSV, Excel, Parquet or Feather)')
 def load_data(name: str, file: str):
     """Load data file for a project."""
+    import pandas as pd
+    
     try:
-        df = project_manager.load_data(name, file)
+        df = project_manager.load_data(name, file, memory_map=True)
         click.echo(f"✅ Loaded {len(df)} rows from {file}")
         click.echo(f"📊 Columns: {', '.join(df.columns.tolist())}")
         
-        # Show valid text columns
-        valid_columns = []
-        for col in df.columns:
-            try:
-                if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
-                    series = df[col].dropna().astype(str).str.strip()
-                    unique_count = series[series != ""].nunique()
-                    if unique_count > 50:
-                        valid_columns.append(f"{col} ({unique_count} unique)")
-            except Exception:
-                continue
-        
+        # Show valid text columns (one strip + nunique pass per text column)
+        text_df = df.select_dtypes(include=['object', 'string'])
+        try:
+            # Arrow-backed strings run strip/nunique in Arrow's C++ kernels
+            text_df = text_df.astype('string[pyarrow]')
+        except ImportError:
+            pass  # pyarrow not installed; scan the object columns as-is
+        unique_counts = {
+            col: series.str.strip().replace('', pd.NA).nunique()
+            for col, series in text_df.items()
+            if pd.api.types.is_string_dtype(series)
+        }
+        valid_columns = [
+            f"{col} ({count} unique)" for col, count in unique_counts.items() if count > 50
+        ]
+
         if valid_columns:
             click.echo(f"📝 Text columns suitable for coding:")
             for col in valid_columns:
@@ -157,31 +177,40 @@ def codebook():
 @click.option('--file', '-f', required=True, type=click.Path(exists=True), help='Codebook file (JSON or CSV)')
 def import_codebook(project: str, file: str):
     """Import a codebook from file."""
+    import pandas as pd
+    
     try:
         # Read and parse codebook file
-        with open(file, 'r') as f:
-            if file.endswith('.json'):
-                data = json.load(f)
-                codebook = Codebook.model_validate(data)
-            elif file.endswith('.csv'):
-                df = pd.read_csv(file)
-                codes = []
-                for _, row in df.iterrows():
-                    code_text = str(row.get('code', '') or '').strip()
-                    desc_text = str(row.get('description', '') or '').strip()
-                    examples = []
-                    if 'examples' in row:
-                        try:
-                            examples = json.loads(str(row['examples']))
-                        except:
-                            examples = [str(row['examples'])] if str(row['examples']).strip() else []
-                    
-                    if code_text:
-                        codes.append(Code(code=code_text, description=desc_text, examples=examples))
-                
-                codebook = Codebook(codes=codes)
-            else:
-                raise ValueError("Unsupported file format. Use JSON or CSV.")
+        if file.endswith('.json'):
+            with open(file, 'rb') as f:
+                data = orjson.loads(f.read())
+            codebook = Codebook.model_validate(data)
+        elif file.endswith('.csv'):
+            # Read only the codebook columns as strings; skips type inference
+            df = pd.read_csv(
+                file,
+                usecols=lambda c: c in CODEBOOK_CSV_COLUMNS,
+                dtype='string',
+                engine='c',
+                na_filter=False
+            )
+            df = df.reindex(columns=CODEBOOK_CSV_COLUMNS, fill_value='')
+            code_texts = df['code'].str.strip().to_numpy()
+            desc_texts = df['description'].str.strip().to_numpy()
+            raw_examples = df['examples'].to_numpy()
+            codes = []
+            for code_text, desc_text, raw in zip(code_texts, desc_texts, raw_examples):
+                try:
+                    examples = orjson.loads(raw)
+                except ValueError:
+                    examples = [raw] if raw.strip() else []
+
+                if code_text:
+                    codes.append(Code(code=code_text, description=desc_text, examples=examples))
+            
+            codebook = Codebook(codes=codes)
+        else:
+            raise ValueError("Unsupported file format. Use JSON or CSV.")
         
         version = project_manager.save_codebook(project, codebook)
         click.echo(f"✅ Imported codebook with {len(codebook.codes)} codes")
@@ -198,6 +227,8 @@ def import_codebook(project: str, file: str):
 @click.option('--format', '-f', type=click.Choice(['json', 'csv']), default='json', help='Export format')
 def export(project: str, output: str, format: str):
     """Export project codebook."""
+    import pandas as pd
+    
     try:
         codebook = project_manager.get_latest_codebook(project)
         if not codebook:
@@ -205,15 +236,15 @@ def export(project: str, output: str, format: str):
             raise click.Abort()
         
         if format == 'json':
-            with open(output, 'w') as f:
-                json.dump(codebook.model_dump(), f, indent=2)
+            with open(output, 'wb') as f:
+                f.write(orjson.dumps(codebook.model_dump(), option=orjson.OPT_INDENT_2))
         elif format == 'csv':
             data = []
             for code in codebook.codes:
                 data.append({
                     'code': code.code,
                     'description': code.description,
-                    'examples': json.dumps(code.examples) if code.examples else ''
+                    'examples': orjson.dumps(code.examples).decode() if code.examples else ''
                 })
             df = pd.DataFrame(data)
             df.to_csv(output, index=False)
@@ -238,9 +269,7 @@ def export():
 def project_data(project: str, output: str, format: str):
     """Export complete project data."""
     try:
-        data = project_manager.export_project_data(project, format)
-        with open(output, 'w') as f:
-            f.write(data)
+        project_manager.export_project_data_to_path(project, output, format=format)
         click.echo(f"✅ Exported project data to {output}")
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
@@ -262,7 +291,7 @@ def classify_text(project: str, text: str, output_format: str):
     try:
         codebook = project_manager.get_latest_codebook(project)
         if not codebook:
-            click.echo(json.dumps({"error": f"No codebook found for project '{project}'"}), err=True)
+            click.echo(orjson.dumps({"error": f"No codebook found for project '{project}'"}).decode(), err=True)
             raise click.Abort()
         
         # Mock classification for now (would integrate with ClassificationService)
@@ -275,7 +304,7 @@ def classify_text(project: str, text: str, output_format: str):
         }
         
         if output_format == 'json':
-            click.echo(json.dumps(result, indent=2))
+            click.echo(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
         else:
             click.echo(f"Project: {result['project']}")
             click.echo(f"Text: {result['text']}")
@@ -284,7 +313,7 @@ def classify_text(project: str, text: str, output_format: str):
         
     except Exception as e:
         error_result = {"error": str(e)}
-        click.echo(json.dumps(error_result), err=True)
+        click.echo(orjson.dumps(error_result).decode(), err=True)
         raise click.Abort()
 
 
@@ -297,39 +326,54 @@ def batch_classify(project: str, input_file: str, output_file: str):
     try:
         codebook = project_manager.get_latest_codebook(project)
         if not codebook:
-            click.echo(json.dumps({"error": f"No codebook found for project '{project}'"}), err=True)
+            click.echo(orjson.dumps({"error": f"No codebook found for project '{project}'"}).decode(), err=True)
             raise click.Abort()
         
-        # Read input file
-        with open(input_file, 'r') as f:
-            texts = [line.strip() for line in f if line.strip()]
-        
-        # Mock batch classification
-        results = []
-        for i, text in enumerate(texts):
-            results.append({
-                "index": i,
-                "text": text,
-                "classification": f"Mock classification for text {i+1}",
-                "confidence": 0.8 + (i * 0.01)  # Mock varying confidence
-            })
+        # IDE selection files are small: read them in one go and split lines
+        # in C. Splitting the bytes breaks only on \n, \r\n and \r, like
+        # line iteration; str.splitlines would also split on form feeds,
+        # vertical tabs (Word's soft line break) and Unicode separators.
+        with open(input_file, 'rb') as f:
+            raw = f.read()
+        texts = [text for text in (line.decode('utf-8').strip() for line in raw.splitlines()) if text]
         
-        output_data = {
+        # Everything but the rows is known up front, so nothing can fail
+        # after output has started
+        header = orjson.dumps({
             "project": project,
-            "processed_count": len(results),
-            "results": results,
-            "timestamp": click.DateTime().today().isoformat()
-        }
+            "processed_count": len(texts),
+            "timestamp": datetime.now().isoformat()
+        })
+        
+        def write_results(out):
+            out.write(header[:-1] + b',"results":[')
+            for i, text in enumerate(texts):
+                out.write(b',\n' if i else b'\n')
+                # Mock batch classification
+                out.write(orjson.dumps({
+                    "index": i,
+                    "text": text,
+                    "classification": f"Mock classification for text {i+1}",
+                    "confidence": 0.8 + (i * 0.01)  # Mock varying confidence
+                }))
+            out.write(b'\n]}\n')
         
         if output_file:
-            with open(output_file, 'w') as f:
-                json.dump(output_data, f, indent=2)
+            # Write beside the target and move into place once complete
+            tmp_path = f"{output_file}.tmp"
+            try:
+                with open(tmp_path, 'wb') as out:
+                    write_results(out)
+                os.replace(tmp_path, output_file)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
             click.echo(f"Results saved to {output_file}")
         else:
-            click.echo(json.dumps(output_data, indent=2))
+            write_results(click.get_binary_stream('stdout'))
         
     except Exception as e:
-        click.echo(json.dumps({"error": str(e)}), err=True)
+        click.echo(orjson.dumps({"error": str(e)}).decode(), err=True)
         raise click.Abort()
 
 
@@ -341,46 +385,53 @@ def export_codebook_for_ide(project: str, output_format: str):
     try:
         codebook = project_manager.get_latest_codebook(project)
         if not codebook:
-            click.echo(json.dumps({"error": f"No codebook found for project '{project}'"}), err=True)
+            click.echo(orjson.dumps({"error": f"No codebook found for project '{project}'"}).decode(), err=True)
             raise click.Abort()
         
         if output_format == 'vscode-snippets':
             # Generate VS Code snippets for each code
             snippets = {}
             for i, code in enumerate(codebook.codes):
-                snippet_key = f"survey-code-{code.code.lower().replace(' ', '-')}"
+                code_lower = code.code.lower()
+                snippet_key = f"survey-code-{code_lower.translate(_SNIPPET_KEY_TABLE)}"
                 snippets[snippet_key] = {
-                    "prefix": f"sc-{code.code.lower()}",
+                    "prefix": f"sc-{code_lower}",
                     "body": [
                         f"Code: {code.code}",
                         f"Description: {code.description}",
                         "Examples:",
-                        *[f"  - {example}" for example in code.examples[:3]]
+                        *[f"  - {example}" for example in itertools.islice(code.examples or (), 3)]
                     ],
                     "description": f"Survey code: {code.code}"
                 }
             
-            click.echo(json.dumps(snippets, indent=2))
+            click.echo(orjson.dumps(snippets, option=orjson.OPT_INDENT_2).decode())
         else:
-            # Standard JSON format
+            # Standard JSON format; one attribute fetch per field per code
+            codes_out = []
+            append = codes_out.append
+            for i, code in enumerate(codebook.codes):
+                examples = code.examples
+                append({
+                    "id": i,
+                    "code": code.code,
+                    "description": code.description,
+                    "examples_count": len(examples),
+                    "examples": examples
+                })
+            
             ide_format = {
                 "project": project,
                 "codebook": {
-                    "total_codes": len(codebook.codes),
-                    "codes": [{
-                        "id": i,
-                        "code": code.code,
-                        "description": code.description,
-                        "examples_count": len(code.examples),
-                        "examples": code.examples
-                    } for i, code in enumerate(codebook.codes)]
+                    "total_codes": len(codes_out),
+                    "codes": codes_out
                 },
                 "timestamp": click.DateTime().today().isoformat()
             }
-            click.echo(json.dumps(ide_format, indent=2))
+            click.echo(orjson.dumps(ide_format, option=orjson.OPT_INDENT_2).decode())
         
     except Exception as e:
-        click.echo(json.dumps({"error": str(e)}), err=True)
+        click.echo(orjson.dumps({"error": str(e)}).decode(), err=True)
         raise click.Abort()
 
 
@@ -3,11 +3,16 @@ Classification service extracted from the original app.py.
 Handles AI-powered survey response classification and codebook generation.
 """
 
-import pandas as pd
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
-import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI
+try:
+    # SDK-private helper; without it requests fall back to parse()
+    from openai.lib._pydantic import to_strict_json_schema
+except ImportError:
+    to_strict_json_schema = None
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
+import orjson
+import itertools
+import asyncio
 
 from ..models.survey_models import (
     Codebook, Code, ClassificationOutput, ClassificationEvidence,
@@ -17,6 +22,97 @@ from ..models.survey_models import (
 # Constants from original app
 BATCH_SIZE = 64
 MAX_CONCURRENCY = 8
+# In-flight request cap for the asyncio batch path; requests share one
+# event loop, so this can sit well above the old thread-pool size
+MAX_ASYNC_CONCURRENCY = MAX_CONCURRENCY * 4
+
+BATCH_SYSTEM_MESSAGE = "You are a survey coding assistant."
+
+
+def _json_schema_format(model) -> Optional[Dict[str, Any]]:
+    """Build a strict json_schema response_format for a pydantic model.
+    
+    Returns None when the installed SDK lacks the strict-schema helper, which
+    sends callers down the chat.completions.parse() path instead.
+    """
+    if to_strict_json_schema is None:
+        return None
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": to_strict_json_schema(model),
+            "strict": True
+        }
+    }
+
+
+# Structured-output formats for the hot paths, derived once at import
+# rather than from the pydantic model on every request
+_CODEBOOK_RESPONSE_FORMAT = _json_schema_format(Codebook)
+_BATCH_RESPONSE_FORMAT = _json_schema_format(BatchClassificationOutput)
+
+def _batch_prompt_template(multi_label: bool, include_explanation: bool) -> str:
+    """Build the batch classification prompt with {question}, {codebook_text}
+    and {indexed} left as format placeholders."""
+    explanation_field = ', "explanation": string' if include_explanation else ''
+    explanation_note = '' if include_explanation else '\\nDo NOT include an "explanation" field.'
+    single_rule = 'For single-label, each items list MUST contain exactly one item.' if not multi_label else ''
+    
+    return f"""Analyze the indexed responses against the codebook.
+Question: "{{question}}"
+Codebook:\\n---\\n{{codebook_text}}\\n---
+Responses (JSON array; "i" is the response index, "t" its text):\\n{{indexed}}
+Return ONLY JSON with this schema:
+{{{{
+  "results": [
+    {{{{ "index": number, "items": [ {{{{ "label": string, "fragment": string, "pertinence": number (0-1){explanation_field} }}}} ] }}}}
+  ]
+}}}}{explanation_note}
+{single_rule}
+For uncovered responses, use an empty list for items.
+"""
+
+
+def _response_prompt_template(multi_label: bool, include_explanation: bool) -> str:
+    """Build the single-response classification prompt with {question},
+    {codebook_text} and {response} left as format placeholders."""
+    explanation_field = ', "explanation": string' if include_explanation else ''
+    explanation_note = '' if include_explanation else '\\n    Do NOT include an "explanation" field.'
+    if multi_label:
+        intro = "Analyze the response and identify ALL themes from the codebook that are present."
+        closing = 'If no codes apply, return {{ "items": [] }}.'
+    else:
+        intro = "Classify the response based on the codebook. Choose the single best code and provide evidence."
+        closing = "For single-label, the list MUST contain exactly one item."
+    
+    return f"""{intro}
+Question: "{{question}}"
+Codebook:\\n---\\n{{codebook_text}}\\n---
+Response: "{{response}}"
+Return ONLY a JSON object with this schema:
+{{{{
+  "items": [
+    {{{{ "label": string, "fragment": string, "pertinence": number (0-1){explanation_field} }}}}
+  ]
+}}}}{explanation_note}
+{closing}
+"""
+
+
+# Prompt scaffolds keyed by (multi_label, include_explanation), built once so
+# each call only fills in the question, codebook and responses
+_PROMPT_VARIANTS = [(m, e) for m in (False, True) for e in (False, True)]
+_BATCH_PROMPTS = {key: _batch_prompt_template(*key) for key in _PROMPT_VARIANTS}
+_RESPONSE_PROMPTS = {key: _response_prompt_template(*key) for key in _PROMPT_VARIANTS}
+
+# Evidence fields copied into result details; "explanation" must stay last
+# so it can be dropped when explanations are disabled
+_DETAIL_FIELDS = ("label", "fragment", "pertinence", "explanation")
+
+# Shared result for responses with no assigned code. The same object is
+# reused for every miss, so callers must treat it as read-only.
+_NO_CODE: Dict[str, Any] = {"Assigned Code": "No Code Applied", "Details": ()}
 
 class ClassificationService:
     """Service for AI-powered survey response classification."""
@@ -24,6 +120,7 @@ class ClassificationService:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.client = OpenAI(api_key=api_key)
+        self.aclient = AsyncOpenAI(api_key=api_key)
     
     def generate_structured_codebook(self, question: str, examples: List[str], 
                                    model: str = "gpt-4o") -> Optional[Codebook]:
@@ -47,7 +144,8 @@ class ClassificationService:
             "You are an expert survey analyst.",
             prompt,
             model=model,
-            pydantic_model=Codebook
+            pydantic_model=Codebook,
+            response_format=_CODEBOOK_RESPONSE_FORMAT
         )
     
     def classify_response(self, question: str, response: str, codebook_text: str,
@@ -95,72 +193,32 @@ class ClassificationService:
             include_explanation: Whether to include explanations
             
         Returns:
-            List of classification results
+            List of classification results aligned with responses. Entries
+            for uncovered responses are the shared, read-only _NO_CODE dict.
         """
         if not responses:
             return []
         
-        indexed = "\\n".join([f"[{i}] \\\"{resp}\\\"" for i, resp in enumerate(responses)])
-        system_msg = "You are a survey coding assistant."
-        explanation_field = ', "explanation": string' if include_explanation else ''
-        explanation_note = '' if include_explanation else '\\nDo NOT include an "explanation" field.'
-        single_rule = 'For single-label, each items list MUST contain exactly one item.' if not multi_label else ''
-        
-        prompt = f"""Analyze the indexed responses against the codebook.
-Question: "{question}"
-Codebook:\\n---\\n{codebook_text}\\n---
-Responses (indexed):\\n{indexed}
-Return ONLY JSON with this schema:
-{{
-  "results": [
-    {{ "index": number, "items": [ {{ "label": string, "fragment": string, "pertinence": number (0-1){explanation_field} }} ] }}
-  ]
-}}{explanation_note}
-{single_rule}
-For uncovered responses, use an empty list for items.
-"""
-        
+        prompt = self._batch_prompt(
+            question, responses, codebook_text, multi_label, include_explanation
+        )
         parsed = self._call_openai_api(
-            system_msg, prompt, model=model, pydantic_model=BatchClassificationOutput
+            BATCH_SYSTEM_MESSAGE, prompt, model=model,
+            pydantic_model=BatchClassificationOutput, response_format=_BATCH_RESPONSE_FORMAT
         )
-        
-        # Build aligned results list
-        aligned: List[Dict[str, Any]] = [{
-            "Assigned Code": "No Code Applied", 
-            "Details": []
-        } for _ in responses]
-        
-        if not parsed or not parsed.results:
-            return aligned
-        
-        for item in parsed.results:
-            if not isinstance(item.index, int) or item.index < 0 or item.index >= len(responses):
-                continue
-            
-            labels = [ev.label for ev in (item.items or [])]
-            label_str = " | ".join(labels) if labels else "No Code Applied"
-            details = [{
-                "label": ev.label,
-                "fragment": ev.fragment,
-                "pertinence": ev.pertinence,
-                "explanation": ev.explanation if include_explanation else None
-            } for ev in (item.items or [])]
-            
-            aligned[item.index] = {
-                "Assigned Code": label_str,
-                "Details": details
-            }
-        
-        return aligned
+        return self._align_batch_results(parsed, len(responses), include_explanation)
     
-    def classify_batches_async(self, question: str, batched_responses: List[List[str]],
+    def classify_batches_async(self, question: str, batched_responses: Iterable[List[str]],
                               codebook_text: str, model: str = "gpt-4o-mini",
                               multi_label: bool = False, include_explanation: bool = True) -> List[List[Dict]]:
-        """Classify multiple batches asynchronously.
+        """Classify multiple batches concurrently.
+        
+        Synchronous wrapper around aclassify_batches for callers without an
+        event loop of their own.
         
         Args:
             question: The survey question
-            batched_responses: List of response batches
+            batched_responses: Response batches, e.g. from chunk_list
             codebook_text: Codebook as text
             model: OpenAI model to use
             multi_label: Whether to allow multiple labels
@@ -172,23 +230,62 @@ For uncovered responses, use an empty list for items.
         if not batched_responses:
             return []
         
-        results: List[List[Dict]] = [None] * len(batched_responses)  # type: ignore
+        async def run() -> List[List[Dict]]:
+            # Pooled connections are bound to the loop that opened them, so
+            # each asyncio.run gets its own client
+            async with AsyncOpenAI(api_key=self.api_key) as client:
+                return await self.aclassify_batches(
+                    question, batched_responses, codebook_text, model,
+                    multi_label, include_explanation, client=client
+                )
         
-        def worker(idx: int, batch: List[str]) -> tuple[int, List[Dict]]:
-            return idx, self.classify_batch(
-                question, batch, codebook_text, model, multi_label, include_explanation
-            )
+        return asyncio.run(run())
+    
+    async def aclassify_batches(self, question: str, batched_responses: Iterable[List[str]],
+                                codebook_text: str, model: str = "gpt-4o-mini",
+                                multi_label: bool = False, include_explanation: bool = True,
+                                client: Optional[AsyncOpenAI] = None) -> List[List[Dict]]:
+        """Classify multiple batches concurrently on the running event loop.
         
-        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
-            future_to_idx = {
-                executor.submit(worker, i, b): i 
-                for i, b in enumerate(batched_responses)
-            }
-            for future in as_completed(future_to_idx):
-                i, res = future.result()
-                results[i] = res
+        Args:
+            question: The survey question
+            batched_responses: Response batches, e.g. from chunk_list
+            codebook_text: Codebook as text
+            model: OpenAI model to use
+            multi_label: Whether to allow multiple labels
+            include_explanation: Whether to include explanations
+            client: Async client to use. Defaults to self.aclient.
+            
+        Returns:
+            List of batch results, in the same order as batched_responses
+        """
+        semaphore = asyncio.Semaphore(MAX_ASYNC_CONCURRENCY)
+        
+        async def worker(batch: List[str]) -> List[Dict]:
+            async with semaphore:
+                return await self._aclassify_batch(
+                    question, batch, codebook_text, model, multi_label,
+                    include_explanation, client
+                )
+        
+        return await asyncio.gather(*[worker(b) for b in batched_responses])
+    
+    async def _aclassify_batch(self, question: str, responses: List[str], codebook_text: str,
+                               model: str, multi_label: bool, include_explanation: bool,
+                               client: Optional[AsyncOpenAI] = None) -> List[Dict[str, Any]]:
+        """Async counterpart of classify_batch."""
+        if not responses:
+            return []
         
-        return results
+        prompt = self._batch_prompt(
+            question, responses, codebook_text, multi_label, include_explanation
+        )
+        parsed = await self._acall_openai_api(
+            BATCH_SYSTEM_MESSAGE, prompt, model=model,
+            pydantic_model=BatchClassificationOutput, response_format=_BATCH_RESPONSE_FORMAT,
+            client=client
+        )
+        return self._align_batch_results(parsed, len(responses), include_explanation)
     
     def merge_codebooks(self, base_codebook: Codebook, new_codebook: Codebook,
                        user_instructions: str = "", model: str = "gpt-4o") -> Optional[Codebook]:
@@ -214,12 +311,16 @@ For uncovered responses, use an empty list for items.
             "You are a master survey analyst.",
             prompt,
             model=model,
-            pydantic_model=Codebook
+            pydantic_model=Codebook,
+            response_format=_CODEBOOK_RESPONSE_FORMAT
         )
     
     def reconstruct_codebook_text(self, codebook: Codebook) -> str:
         """Convert codebook to text format for prompts.
         
+        Not cached, since codebooks are edited in place. Batch callers build
+        the text once and pass it to every batch as ``codebook_text``.
+        
         Args:
             codebook: Codebook object
             
@@ -235,7 +336,8 @@ For uncovered responses, use an empty list for items.
         ]).strip()
     
     def _call_openai_api(self, system_prompt: str, user_prompt: str,
-                        model: str = "gpt-4o", pydantic_model=None):
+                        model: str = "gpt-4o", pydantic_model=None,
+                        response_format: Optional[Dict[str, Any]] = None):
         """Make API call to OpenAI.
         
         Args:
@@ -243,12 +345,26 @@ For uncovered responses, use an empty list for items.
             user_prompt: User message
             model: Model to use
             pydantic_model: Pydantic model for structured output
+            response_format: Precomputed json_schema format for pydantic_model.
+                When given, the schema is not re-derived for this request and
+                the raw JSON reply is validated directly by pydantic-core.
             
         Returns:
             Parsed response or None if failed
         """
         try:
-            if pydantic_model:
+            if pydantic_model and response_format:
+                completion = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format=response_format
+                )
+                content = completion.choices[0].message.content
+                return pydantic_model.model_validate_json(content)
+            elif pydantic_model:
                 completion = self.client.chat.completions.parse(
                     model=model,
                     messages=[
@@ -272,43 +388,123 @@ For uncovered responses, use an empty list for items.
             print(f"API Error: {e}")
             return None
     
+    async def _acall_openai_api(self, system_prompt: str, user_prompt: str,
+                                model: str = "gpt-4o", pydantic_model=None,
+                                response_format: Optional[Dict[str, Any]] = None,
+                                client: Optional[AsyncOpenAI] = None):
+        """Async counterpart of _call_openai_api.
+        
+        Args:
+            system_prompt: System message
+            user_prompt: User message
+            model: Model to use
+            pydantic_model: Pydantic model for structured output
+            response_format: Precomputed json_schema format for pydantic_model
+            client: Async client to use. Defaults to self.aclient.
+            
+        Returns:
+            Parsed response or None if failed
+        """
+        client = client or self.aclient
+        try:
+            if pydantic_model and response_format:
+                completion = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format=response_format
+                )
+                content = completion.choices[0].message.content
+                return pydantic_model.model_validate_json(content)
+            elif pydantic_model:
+                completion = await client.chat.completions.parse(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    response_format=pydantic_model
+                )
+                return completion.choices[0].message.parsed
+            else:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.0
+                )
+                return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"API Error: {e}")
+            return None
+    
+    def _batch_prompt(self, question: str, responses: List[str], codebook_text: str,
+                      multi_label: bool, include_explanation: bool) -> str:
+        """Generate prompt for batch classification."""
+        # Real JSON keeps quotes inside responses unambiguous for the model
+        indexed = orjson.dumps([{"i": i, "t": resp} for i, resp in enumerate(responses)]).decode()
+        return _BATCH_PROMPTS[(multi_label, include_explanation)].format_map({
+            "question": question,
+            "codebook_text": codebook_text,
+            "indexed": indexed
+        })
+    
+    @staticmethod
+    def _align_batch_results(parsed: Optional[BatchClassificationOutput], count: int,
+                             include_explanation: bool) -> List[Dict[str, Any]]:
+        """Align parsed batch output with the submitted responses.
+        
+        Entries for uncovered responses are the shared, read-only _NO_CODE dict.
+        Details omit the "explanation" key unless include_explanation is set.
+        """
+        detail_fields = _DETAIL_FIELDS if include_explanation else _DETAIL_FIELDS[:-1]
+        aligned: List[Optional[Dict[str, Any]]] = [None] * count
+        
+        batch_results = parsed.results if parsed else None
+        for item in batch_results or []:
+            # index is an int by schema; only the range needs checking
+            if item.index < 0 or item.index >= count:
+                continue
+            
+            # Pydantic v2 keeps field values in __dict__; reading them there
+            # skips the attribute descriptor path for every evidence item
+            evidence = [ev.__dict__ for ev in item.items]
+            labels = [ev["label"] for ev in evidence]
+            label_str = " | ".join(labels) if labels else "No Code Applied"
+            details = [{field: ev[field] for field in detail_fields} for ev in evidence]
+            
+            aligned[item.index] = {
+                "Assigned Code": label_str,
+                "Details": details
+            }
+        
+        for i, value in enumerate(aligned):
+            if value is None:
+                aligned[i] = _NO_CODE
+        
+        return aligned
+    
     def _classify_response_prompt(self, question: str, response: str, codebook_text: str,
                                  include_explanation: bool = True) -> str:
         """Generate prompt for single-label classification."""
-        explanation_field = ', "explanation": string' if include_explanation else ''
-        explanation_note = '' if include_explanation else '\\n    Do NOT include an "explanation" field.'
-        
-        return f"""Classify the response based on the codebook. Choose the single best code and provide evidence.
-Question: "{question}"
-Codebook:\\n---\\n{codebook_text}\\n---
-Response: "{response}"
-Return ONLY a JSON object with this schema:
-{{
-  "items": [
-    {{ "label": string, "fragment": string, "pertinence": number (0-1){explanation_field} }}
-  ]
-}}{explanation_note}
-For single-label, the list MUST contain exactly one item.
-"""
+        return _RESPONSE_PROMPTS[(False, include_explanation)].format_map({
+            "question": question,
+            "codebook_text": codebook_text,
+            "response": response
+        })
     
     def _classify_response_prompt_multi(self, question: str, response: str, codebook_text: str,
                                        include_explanation: bool = True) -> str:
         """Generate prompt for multi-label classification."""
-        explanation_field = ', "explanation": string' if include_explanation else ''
-        explanation_note = '' if include_explanation else '\\n    Do NOT include an "explanation" field.'
-        
-        return f"""Analyze the response and identify ALL themes from the codebook that are present.
-Question: "{question}"
-Codebook:\\n---\\n{codebook_text}\\n---
-Response: "{response}"
-Return ONLY a JSON object with this schema:
-{{
-  "items": [
-    {{ "label": string, "fragment": string, "pertinence": number (0-1){explanation_field} }}
-  ]
-}}{explanation_note}
-If no codes apply, return {{ "items": [] }}.
-"""
+        return _RESPONSE_PROMPTS[(True, include_explanation)].format_map({
+            "question": question,
+            "codebook_text": codebook_text,
+            "response": response
+        })
     
     def _create_merge_prompt(self, codebook1_json: str, codebook2_json: str,
                            user_instructions: str = "") -> str:
@@ -327,22 +523,22 @@ If no codes apply, return {{ "items": [] }}.
         return prompt
     
     def _serialize_codebook_for_prompt(self, codebook: Codebook) -> str:
-        """Serialize codebook for prompt use."""
-        try:
-            payload = {
-                "codes": [
-                    {
-                        "code": c.code,
-                        "description": c.description,
-                        "examples": c.examples or []
-                    } for c in (codebook.codes or [])
-                ]
-            }
-            return json.dumps(payload, indent=2)
-        except Exception:
-            return codebook.model_dump_json(indent=2)
+        """Serialize codebook for prompt use.
+        
+        Compact JSON: indentation only adds prompt tokens for the model.
+        """
+        return orjson.dumps({
+            "codes": [
+                {
+                    "code": c.code,
+                    "description": c.description,
+                    "examples": c.examples or []
+                } for c in (codebook.codes or [])
+            ]
+        }).decode()
     
     @staticmethod
-    def chunk_list(items: List[str], size: int) -> List[List[str]]:
-        """Split list into chunks of specified size."""
-        return [items[i:i+size] for i in range(0, len(items), size)]
\ No newline at end of file
+    def chunk_list(items: Iterable[str], size: int) -> Iterator[List[str]]:
+        """Lazily split items into chunks of specified size."""
+        it = iter(items)
+        return iter(lambda: list(itertools.islice(it, size)), [])
@@ -3,13 +3,85 @@ Project management service for survey coding projects.
 Handles project CRUD operations and coordinates with database.
 """
 
-import pandas as pd
-import json
-from typing import Optional, List, Dict, Any
+import hashlib
+import importlib.util
+import io
+import os
+import orjson
+from typing import IO, Optional, List, Dict, Any, Tuple, TYPE_CHECKING
 from datetime import datetime
 
-from ..models.survey_models import ProjectMetadata, Codebook, ClassificationResult
-from ..storage.database import db, Project
+from ..models.survey_models import ProjectMetadata, Code, Codebook, ClassificationResult
+from ..storage.database import CODEBOOK_SCHEMA_VERSION, db, Project
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from sqlalchemy.orm import Session
+
+# Optional faster parsers, used when installed (checked without importing)
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+_HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+_HAS_POLARS = importlib.util.find_spec("polars") is not None
+
+
+def _read_csv(file_path: str, memory_map: bool) -> "pd.DataFrame":
+    """Read a CSV file, with the Arrow parser when available."""
+    import pandas as pd
+    
+    if _HAS_PYARROW:
+        # Multithreaded Arrow parser straight into Arrow-backed columns
+        return pd.read_csv(
+            file_path,
+            encoding='latin1',
+            engine='pyarrow',
+            dtype_backend='pyarrow'
+        )
+    return pd.read_csv(
+        file_path,
+        encoding='latin1',
+        engine='c',
+        memory_map=memory_map,
+        low_memory=False
+    )
+
+
+def _read_excel(file_path: str, memory_map: bool) -> "pd.DataFrame":
+    """Read the first sheet of an Excel workbook."""
+    import pandas as pd
+    
+    if _HAS_CALAMINE:
+        # Rust workbook reader; much faster than openpyxl on large sheets
+        return pd.read_excel(file_path, engine='calamine')
+    return pd.read_excel(file_path)
+
+
+def _read_parquet(file_path: str, memory_map: bool) -> "pd.DataFrame":
+    """Read a Parquet file."""
+    import pandas as pd
+    
+    return pd.read_parquet(file_path)
+
+
+def _read_feather(file_path: str, memory_map: bool) -> "pd.DataFrame":
+    """Read a Feather (Arrow IPC) file."""
+    import pandas as pd
+    
+    return pd.read_feather(file_path)
+
+
+# Data file readers by lowercase extension
+_READERS = {
+    '.csv': _read_csv,
+    '.xls': _read_excel,
+    '.xlsx': _read_excel,
+    '.parquet': _read_parquet,
+    '.feather': _read_feather,
+}
+# Already columnar; not worth a Parquet cache copy
+_COLUMNAR_EXTENSIONS = {'.parquet', '.feather'}
+# Readers that return Arrow-backed columns (the cache only exists with
+# pyarrow installed, so the CSV reader always takes its Arrow path)
+_ARROW_BACKED_EXTENSIONS = {'.csv'}
 
 
 class ProjectManager:
@@ -17,6 +89,8 @@ class ProjectManager:
     
     def __init__(self):
         self.db = db
+        # Project id -> (last_modified, metadata); stale once the row changes
+        self._meta_cache: Dict[int, Tuple[Optional[datetime], ProjectMetadata]] = {}
     
     def create_project(self, name: str, description: str = "", 
                       question_text: str = "", column_to_code: str = "") -> ProjectMetadata:
@@ -60,8 +134,7 @@ class ProjectManager:
         Returns:
             List of ProjectMetadata objects
         """
-        projects = self.db.list_projects()
-        return [self._project_to_metadata(p) for p in projects]
+        return [self._project_to_metadata(p) for p in self.db.iter_projects()]
     
     def update_project(self, name: str, **kwargs) -> Optional[ProjectMetadata]:
         """Update project fields.
@@ -85,28 +158,65 @@ class ProjectManager:
         Returns:
             True if deleted, False if not found
         """
-        return self.db.delete_project(name)
+        project = self.db.get_project(name)
+        deleted = self.db.delete_project(name)
+        if project:
+            self._meta_cache.pop(project.id, None)
+            self._remove_data_cache(project.data_path)
+        return deleted
     
-    def load_data(self, project_name: str, file_path: str) -> pd.DataFrame:
+    def load_data(self, project_name: str, file_path: str,
+                  memory_map: bool = False) -> "pd.DataFrame":
         """Load data file for a project.
         
+        The parsed data is cached as Parquet next to the project database, and
+        later loads of the same, unmodified file read that copy instead.
+        
         Args:
             project_name: Project name
-            file_path: Path to CSV or Excel file
+            file_path: Path to CSV, Excel, Parquet or Feather file
+            memory_map: Memory-map CSV files instead of buffered reads, so
+                follow-up scans of the same file are served from page cache.
+                Only applies when pyarrow is unavailable; Arrow's CSV reader
+                manages its own I/O.
             
         Returns:
             Loaded DataFrame
         """
+        import pandas as pd
+        
         try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path, encoding='latin1')
-            elif file_path.endswith(('.xls', '.xlsx')):
-                df = pd.read_excel(file_path)
-            else:
-                raise ValueError("Unsupported file format. Use CSV or Excel files.")
+            extension = os.path.splitext(file_path)[1].lower()
+            reader = _READERS.get(extension)
+            if reader is None:
+                raise ValueError("Unsupported file format. Use CSV, Excel, Parquet or Feather files.")
+            
+            project = self.db.get_project(project_name)
+            if not project:
+                raise ValueError(f"Project '{project_name}' not found")
+            
+            cache_path = self._data_cache_path(project.id, file_path)
+            if (project.data_path == cache_path and os.path.exists(cache_path)
+                    and os.path.getmtime(cache_path) >= os.path.getmtime(file_path)):
+                # Match the dtypes a fresh read of the source would give
+                if extension in _ARROW_BACKED_EXTENSIONS:
+                    return pd.read_parquet(cache_path, dtype_backend='pyarrow')
+                return pd.read_parquet(cache_path)
+            
+            df = reader(file_path, memory_map)
             
             # Store data location in project metadata (could be improved)
-            self.update_project(project_name, description=f"Data loaded from {file_path}")
+            updates = {'description': f"Data loaded from {file_path}"}
+            if _HAS_PYARROW and extension not in _COLUMNAR_EXTENSIONS:
+                try:
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    df.to_parquet(cache_path, engine='pyarrow', compression='zstd')
+                    updates['data_path'] = cache_path
+                except Exception:
+                    pass  # Caching is best-effort; the parsed data is still returned
+                else:
+                    self._remove_data_cache(project.data_path, keep=cache_path)
+            self.update_project(project_name, **updates)
             
             return df
         except Exception as e:
@@ -122,12 +232,10 @@ class ProjectManager:
         Returns:
             Version number of saved codebook
         """
-        project = self.db.get_project(project_name)
-        if not project:
-            raise ValueError(f"Project '{project_name}' not found")
+        project_id = self._project_id(project_name)
         
         codebook_data = codebook.model_dump()
-        codebook_version = self.db.save_codebook(project.id, codebook_data)
+        codebook_version = self.db.save_codebook(project_id, codebook_data)
         return codebook_version.version
     
     def get_latest_codebook(self, project_name: str) -> Optional[Codebook]:
@@ -139,15 +247,32 @@ class ProjectManager:
         Returns:
             Codebook or None if not found
         """
-        project = self.db.get_project(project_name)
-        if not project:
+        try:
+            project_id = self._project_id(project_name)
+        except ValueError:
             return None
         
-        codebook_version = self.db.get_latest_codebook(project.id)
+        codebook_version = self.db.get_latest_codebook(project_id)
         if not codebook_version:
             return None
         
-        return Codebook.model_validate(codebook_version.data)
+        return self._codebook_from_row(codebook_version)
+    
+    @staticmethod
+    def _codebook_from_row(codebook_version) -> Codebook:
+        """Rebuild a Codebook from a stored codebook version.
+        
+        Data written under the current schema came from a validated Codebook,
+        so it is rebuilt without validating again. Older rows are validated.
+        """
+        data = codebook_version.data
+        if codebook_version.schema_version != CODEBOOK_SCHEMA_VERSION:
+            return Codebook.model_validate(data)
+        
+        # model_construct does not build nested models, so do the codes too
+        return Codebook.model_construct(
+            **{**data, 'codes': [Code.model_construct(**code) for code in data['codes']]}
+        )
     
     def save_classification_results(self, project_name: str, results: List[Dict[str, Any]]) -> int:
         """Save classification results for a project.
@@ -159,31 +284,19 @@ class ProjectManager:
         Returns:
             Number of results saved
         """
-        project = self.db.get_project(project_name)
-        if not project:
-            raise ValueError(f"Project '{project_name}' not found")
-        
-        # Get the latest codebook for reference
-        latest_codebook = self.db.get_latest_codebook(project.id)
-        codebook_id = latest_codebook.id if latest_codebook else None
-        
-        saved_count = 0
-        for result in results:
+        # Project, codebook lookup and insert share one transaction
+        with self.db.session_scope() as session:
+            project_id = self._project_id(project_name, session=session)
             try:
-                self.db.save_classification(
-                    project_id=project.id,
-                    codebook_id=codebook_id,
-                    response_text=result.get('response_text', ''),
-                    assigned_codes=result.get('assigned_codes', []),
-                    details=result.get('details', [])
+                latest_codebook = self.db.get_latest_codebook(project_id, session=session)
+                codebook_id = latest_codebook.id if latest_codebook else None
+                return self.db.save_classifications_bulk(
+                    project_id, codebook_id, results, session=session
                 )
-                saved_count += 1
             except Exception as e:
-                print(f"Failed to save classification result: {e}")
-        
-        return saved_count
+                raise ValueError(f"Failed to save classification results: {e}")
     
-    def get_project_results(self, project_name: str) -> pd.DataFrame:
+    def get_project_results(self, project_name: str) -> "pd.DataFrame":
         """Get all classification results for a project as DataFrame.
         
         Args:
@@ -192,61 +305,160 @@ class ProjectManager:
         Returns:
             DataFrame with classification results
         """
-        project = self.db.get_project(project_name)
-        if not project:
-            raise ValueError(f"Project '{project_name}' not found")
-        
-        classifications = self.db.get_project_classifications(project.id)
-        
-        if not classifications:
-            return pd.DataFrame()
-        
-        # Convert to DataFrame
-        data = []
-        for c in classifications:
-            assigned_codes_str = " | ".join(c.assigned_codes) if c.assigned_codes else "No Code Applied"
-            data.append({
-                'response_text': c.response_text,
-                'assigned_codes': assigned_codes_str,
-                'details': json.dumps(c.details) if c.details else '',
-                'created_at': c.created_at.isoformat() if c.created_at else ''
-            })
+        project_id = self._project_id(project_name)
+        return self._results_frame(self.db.get_project_classifications_columns(project_id))
+    
+    @classmethod
+    def _results_frame(cls, columns: tuple) -> "pd.DataFrame":
+        """Build the results DataFrame from classification column lists."""
+        import pandas as pd
         
-        return pd.DataFrame(data)
+        data = cls._result_columns(columns)
+        return pd.DataFrame(data) if data['response_text'] else pd.DataFrame()
+    
+    @staticmethod
+    def _result_columns(columns: tuple) -> Dict[str, list]:
+        """Format classification column lists as export-ready columns."""
+        texts, codes, details, created = columns
+        # Build each column in one pass instead of a dict per row
+        return {
+            'response_text': texts,
+            'assigned_codes': codes,
+            # Already JSON text from storage; empty lists and legacy JSON
+            # nulls export as ''
+            'details': [d if d and d not in ('[]', 'null') else '' for d in details],
+            'created_at': [c.isoformat() if c else '' for c in created]
+        }
     
-    def export_project_data(self, project_name: str, format: str = 'json') -> str:
+    def export_project_data(self, project_name: str, format: str = 'json',
+                            out: Optional[IO[str]] = None) -> Optional[str]:
         """Export project data.
         
+        Results are written straight from the stored columns without building
+        a DataFrame for JSON, and with polars for CSV when it is installed.
+        
         Args:
             project_name: Project name
             format: Export format ('json' or 'csv')
+            out: Text stream to write the export to. If None, the export is
+                returned as a string instead.
             
         Returns:
-            Exported data as string
+            Exported data as string, or None when written to ``out``
         """
-        project_meta = self.get_project(project_name)
-        if not project_meta:
-            raise ValueError(f"Project '{project_name}' not found")
+        if format.lower() not in ('json', 'csv'):
+            raise ValueError("Format must be 'json' or 'csv'")
         
-        codebook = self.get_latest_codebook(project_name)
-        results_df = self.get_project_results(project_name)
+        if out is None:
+            buffer = io.StringIO()
+            self.export_project_data(project_name, format, out=buffer)
+            return buffer.getvalue()
         
-        export_data = {
-            'project': project_meta.model_dump(),
-            'codebook': codebook.model_dump() if codebook else None,
-            'results': results_df.to_dict('records') if not results_df.empty else []
-        }
+        # One read transaction gives a consistent snapshot of the project
+        with self.db.session_scope() as session:
+            project = self.db.get_project(project_name, session=session)
+            if not project:
+                raise ValueError(f"Project '{project_name}' not found")
+            codebook_version = self.db.get_latest_codebook(project.id, session=session)
+            columns = self.db.get_project_classifications_columns(project.id, session=session)
+        
+        data = self._result_columns(columns)
         
         if format.lower() == 'json':
-            return json.dumps(export_data, indent=2, default=str)
-        elif format.lower() == 'csv':
+            codebook = self._codebook_from_row(codebook_version) if codebook_version else None
+            header = orjson.dumps(
+                {
+                    'project': self._project_to_metadata(project).model_dump(),
+                    'codebook': codebook.model_dump() if codebook else None,
+                },
+                default=str
+            ).decode()
+            # Reopen the header object and stream the results array into it
+            out.write(header[:-1] + ',"results":[')
+            names = list(data)
+            separator = '\n'
+            for row in zip(*data.values()):
+                out.write(separator)
+                out.write(orjson.dumps(dict(zip(names, row))).decode())
+                separator = ',\n'
+            out.write('\n]}\n')
+        elif data['response_text']:
             # For CSV, just export the results
-            if not results_df.empty:
-                return results_df.to_csv(index=False)
+            if _HAS_POLARS:
+                import polars as pl
+                
+                # Polars' native CSV writer is much faster on long text columns
+                pl.DataFrame(data).write_csv(out)
             else:
-                return ""
-        else:
-            raise ValueError("Format must be 'json' or 'csv'")
+                import pandas as pd
+                
+                pd.DataFrame(data).to_csv(out, index=False, lineterminator='\n', chunksize=50_000)
+        return None
+    
+    def export_project_data_to_path(self, project_name: str, path: str,
+                                    format: Optional[str] = None) -> None:
+        """Export project data straight to a file.
+        
+        The export is written to a temporary file next to ``path`` and moved
+        into place only once complete, so a failed export never truncates or
+        half-writes an existing file.
+        
+        Args:
+            project_name: Project name
+            path: Output path
+            format: 'json', 'csv' or 'parquet' (results only). If None, it is
+                taken from the path's extension.
+        """
+        format = (format or os.path.splitext(path)[1][1:]).lower()
+        if format not in ('json', 'csv', 'parquet'):
+            raise ValueError("Export format must be 'json', 'csv' or 'parquet'")
+        if format == 'parquet' and not _HAS_PYARROW:
+            raise ValueError("Parquet export requires pyarrow; install it or use json/csv")
+        if not self.db.get_project(project_name):
+            raise ValueError(f"Project '{project_name}' not found")
+        
+        tmp_path = f"{path}.tmp"
+        try:
+            if format == 'parquet':
+                results_df = self.get_project_results(project_name)
+                results_df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    self.export_project_data(project_name, format, out=f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _data_cache_path(self, project_id: int, file_path: str) -> str:
+        """Parquet cache location for a project's data file.
+        
+        Keyed by the source file's absolute path, so loading a different file
+        never reuses another file's cache.
+        """
+        source_key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:12]
+        data_dir = os.path.join(os.path.dirname(self.db.db_path), "project_data")
+        return os.path.join(data_dir, f"{project_id}-{source_key}.parquet")
+    
+    @staticmethod
+    def _remove_data_cache(data_path: Optional[str], keep: Optional[str] = None):
+        """Delete a stale Parquet cache file, if any."""
+        if data_path and data_path != keep and os.path.exists(data_path):
+            os.remove(data_path)
+    
+    def _project_id(self, name: str, session: Optional["Session"] = None) -> int:
+        """Look up a project's id by name.
+        
+        Not cached across calls: another process may delete or rename the
+        project, and SQLite can hand its id to a new one.
+        
+        Raises:
+            ValueError: If the project does not exist
+        """
+        project = self.db.get_project(name, session=session)
+        if not project:
+            raise ValueError(f"Project '{name}' not found")
+        return project.id
     
     def _project_to_metadata(self, project: Project) -> ProjectMetadata:
         """Convert database Project to ProjectMetadata.
@@ -255,9 +467,13 @@ class ProjectManager:
             project: Database project object
             
         Returns:
-            ProjectMetadata object
+            ProjectMetadata object, reused while the project is unmodified
         """
-        return ProjectMetadata(
+        cached = self._meta_cache.get(project.id)
+        if cached is not None and cached[0] == project.last_modified:
+            return cached[1]
+        
+        metadata = ProjectMetadata(
             name=project.name,
             description=project.description,
             question_text=project.question_text,
@@ -265,6 +481,8 @@ class ProjectManager:
             created_at=project.created_at.isoformat() if project.created_at else None,
             last_modified=project.last_modified.isoformat() if project.last_modified else None
         )
+        self._meta_cache[project.id] = (project.last_modified, metadata)
+        return metadata
 
 
 # Global project manager instance
@@ -3,16 +3,134 @@ Database models and connection management using SQLAlchemy.
 Implements persistent storage for survey coding projects.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, ForeignKey
+from sqlalchemy import bindparam, create_engine, event, func, insert, inspect, select, text, type_coerce, update, Column, Integer, String, Text, DateTime, JSON, LargeBinary, ForeignKey, Index
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from contextlib import contextmanager
 from datetime import datetime
 import json
+import logging
 import os
-from typing import Optional, List
+from typing import Iterator, Optional, List, Dict, Any, Tuple
+import zlib
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# Bump when the stored Codebook layout changes; older rows are re-validated
+CODEBOOK_SCHEMA_VERSION = 1
+
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def assigned_codes_display(assigned_codes: Optional[List[str]]) -> str:
+    """Display form of a result's assigned codes, stored alongside them."""
+    return " | ".join(assigned_codes) if assigned_codes else "No Code Applied"
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON value stored as compressed orjson bytes.
+    
+    Uses zstd when the zstandard package is installed and zlib otherwise.
+    Reads tell the two apart by the zstd frame header, and rows written as
+    plain JSON text before this type existed still load.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        raw = orjson.dumps(value)
+        if zstandard is not None:
+            return zstandard.ZstdCompressor().compress(raw)
+        return zlib.compress(raw)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.loads(self.decompress(value))
+    
+    @staticmethod
+    def decompress(value):
+        """Stored value back to its serialized JSON (bytes, or str for legacy rows)."""
+        if isinstance(value, str):
+            return value
+        if value.startswith(_ZSTD_MAGIC):
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read this database")
+            return zstandard.ZstdDecompressor().decompress(value)
+        return zlib.decompress(value)
+
+
+class CompressedJSONText(CompressedJSON):
+    """Read-side view of a CompressedJSON column as its JSON text.
+    
+    Skips the parse/re-serialize round trip for readers that only pass the
+    JSON along.
+    """
+    cache_ok = True
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        raw = self.decompress(value)
+        return raw if isinstance(raw, str) else raw.decode()
+
+
+class DelimitedList(TypeDecorator):
+    """List of strings stored as one delimited TEXT value.
+    
+    Uses the ASCII unit separator, which cannot occur in a code label typed
+    by a user. Databases that stored the list as JSON are converted once at
+    startup (see DatabaseManager._convert_legacy_assigned_codes).
+    """
+    impl = Text
+    cache_ok = True
+    
+    separator = '\x1f'
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.separator.join(value)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if not value:
+            return []
+        return value.split(self.separator)
+    
+    @classmethod
+    def from_legacy(cls, value) -> Optional[List[str]]:
+        """Decode a value from a column that stored the list as JSON.
+        
+        Such a column may also hold delimited values written before it was
+        converted, so anything that isn't a JSON list or null is split.
+        """
+        if value is None:
+            return None
+        value = str(value)
+        try:
+            decoded = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            decoded = value
+        if decoded is None or isinstance(decoded, list):
+            return decoded
+        return value.split(cls.separator) if value else []
+
 
 class Project(Base):
     """Database model for survey coding projects."""
@@ -23,6 +141,7 @@ class Project(Base):
     description = Column(Text)
     question_text = Column(Text)
     column_to_code = Column(String(255))
+    data_path = Column(String(1024))  # Parquet copy of the last loaded data file
     created_at = Column(DateTime, default=datetime.utcnow)
     last_modified = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -34,11 +153,16 @@ class Project(Base):
 class CodebookVersion(Base):
     """Database model for codebook versions."""
     __tablename__ = 'codebooks'
+    __table_args__ = (
+        # Serves the latest-version lookup for a project
+        Index('ix_codebooks_project_version', 'project_id', 'version'),
+    )
     
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
     version = Column(Integer, nullable=False)
     data = Column(JSON, nullable=False)  # Stores the Codebook pydantic model as JSON
+    schema_version = Column(Integer)  # CODEBOOK_SCHEMA_VERSION the data was written with
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -49,13 +173,18 @@ class CodebookVersion(Base):
 class Classification(Base):
     """Database model for classification results."""
     __tablename__ = 'classifications'
+    __table_args__ = (
+        # Serves the newest-first listing of a project's results
+        Index('ix_classifications_project_created', 'project_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
     codebook_id = Column(Integer, ForeignKey('codebooks.id'))
     response_text = Column(Text, nullable=False)
-    assigned_codes = Column(JSON)  # List of assigned code labels
-    details = Column(JSON)  # List of ClassificationEvidence objects
+    assigned_codes = Column(DelimitedList)  # List of assigned code labels
+    assigned_codes_display = Column(Text)  # Codes joined for display, set on insert
+    details = Column(CompressedJSON)  # List of ClassificationEvidence objects
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -63,6 +192,27 @@ class Classification(Base):
     codebook = relationship("CodebookVersion", back_populates="classifications")
 
 
+# Hot-path reads as Core statements: rows come back as lightweight Row
+# tuples (attribute access by column name) without ORM instrumentation, and
+# building them once lets every call hit the compiled-SQL cache
+_GET_PROJECT_STMT = select(Project.__table__)\
+    .where(Project.name == bindparam('name'))
+_GET_LATEST_CODEBOOK_STMT = select(CodebookVersion.__table__)\
+    .where(CodebookVersion.project_id == bindparam('project_id'))\
+    .order_by(CodebookVersion.version.desc())\
+    .limit(1)
+# Bulk-saved rows share a timestamp; id keeps their order stable
+_GET_CLASSIFICATIONS_STMT = select(Classification.__table__)\
+    .where(Classification.project_id == bindparam('project_id'))\
+    .order_by(Classification.created_at.desc(), Classification.id.desc())
+_GET_CLASSIFICATION_COLUMNS_STMT = _GET_CLASSIFICATIONS_STMT.with_only_columns(
+    Classification.response_text,
+    Classification.assigned_codes_display,
+    type_coerce(Classification.details, CompressedJSONText).label('details'),
+    Classification.created_at
+)
+
+
 class DatabaseManager:
     """Manages database connections and operations."""
     
@@ -79,16 +229,150 @@ class DatabaseManager:
             db_path = os.path.join(data_dir, "projects.db")
         
         self.db_path = db_path
-        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        self.engine = create_engine(
+            f'sqlite:///{db_path}',
+            echo=False,
+            connect_args={"check_same_thread": False}
+        )
+        
+        @event.listens_for(self.engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            # WAL lets readers run alongside a writer, and NORMAL sync drops
+            # the per-commit fsync that dominates small write transactions
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            # Keep temp tables in memory, read through a 256 MB memory map
+            # and a 64 MB page cache instead of the 2 MB default
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA mmap_size=268435456")
+            cursor.execute("PRAGMA cache_size=-65536")
+            cursor.close()
+        
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         
         # Create tables if they don't exist
         Base.metadata.create_all(bind=self.engine)
+        # create_all skips tables that already exist, so add any columns and
+        # indexes introduced since an existing database was created
+        added = self._add_missing_columns()
+        self._convert_legacy_assigned_codes()
+        # Must run after the conversion, which maps legacy JSON null to NULL
+        if ('classifications', 'assigned_codes_display') in added:
+            self._backfill_assigned_codes_display()
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=self.engine, checkfirst=True)
+    
+    def _add_missing_columns(self) -> List[Tuple[str, str]]:
+        """Add model columns missing from existing tables (nullable only).
+        
+        Returns:
+            (table, column) names of the columns added
+        """
+        added = []
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(
+                            f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                        ))
+                        added.append((table.name, column.name))
+        return added
+    
+    def _convert_legacy_assigned_codes(self):
+        """Rewrite a JSON-typed assigned_codes column as delimited TEXT.
+        
+        A column declared JSON has numeric affinity in SQLite, which would
+        turn a label such as "007" into 7, so the column is recreated as TEXT
+        rather than only rewriting its values. The table is rebuilt (create,
+        copy, drop, rename) because ALTER TABLE ... DROP COLUMN needs SQLite
+        3.35+, newer than some distributions ship.
+        """
+        inspector = inspect(self.engine)
+        columns = {c['name']: c['type'] for c in inspector.get_columns('classifications')}
+        if not isinstance(columns.get('assigned_codes'), JSON):
+            return
+        
+        classifications = Classification.__table__
+        create_ddl = str(CreateTable(classifications).compile(dialect=self.engine.dialect))
+        copied = ', '.join(
+            c.name for c in classifications.columns
+            if c.name in columns and c.name != 'assigned_codes'
+        )
+        with self.engine.begin() as conn:
+            # Left over from an interrupted conversion; the original is intact
+            conn.execute(text('DROP TABLE IF EXISTS classifications_new'))
+            conn.execute(text(create_ddl.replace(
+                'CREATE TABLE classifications ', 'CREATE TABLE classifications_new ', 1
+            )))
+            conn.execute(text(
+                f'INSERT INTO classifications_new ({copied}) SELECT {copied} FROM classifications'
+            ))
+            rows = conn.execute(text('SELECT id, assigned_codes FROM classifications')).all()
+            # Indexes go with the old table; __init__ recreates them afterwards
+            conn.execute(text('DROP TABLE classifications'))
+            conn.execute(text('ALTER TABLE classifications_new RENAME TO classifications'))
+            if rows:
+                conn.execute(
+                    update(classifications)
+                    .where(classifications.c.id == bindparam('row_id'))
+                    .values(assigned_codes=bindparam('codes', type_=DelimitedList())),
+                    [{'row_id': row_id, 'codes': DelimitedList.from_legacy(raw)}
+                     for row_id, raw in rows]
+                )
+    
+    def _backfill_assigned_codes_display(self):
+        """Fill assigned_codes_display for results saved before it existed."""
+        classifications = Classification.__table__
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(classifications.c.id, classifications.c.assigned_codes)
+                .where(classifications.c.assigned_codes_display.is_(None))
+            ).all()
+            if rows:
+                conn.execute(
+                    update(classifications)
+                    .where(classifications.c.id == bindparam('row_id'))
+                    .values(assigned_codes_display=bindparam('display')),
+                    [{'row_id': row.id, 'display': assigned_codes_display(row.assigned_codes)}
+                     for row in rows]
+                )
     
     def get_session(self):
         """Get a database session."""
         return self.SessionLocal()
     
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """Run several operations in one session and transaction.
+        
+        Commits on success and rolls back on error. Objects loaded in the
+        scope stay readable after it closes.
+        """
+        session = self.SessionLocal(expire_on_commit=False)
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
+    @contextmanager
+    def _session(self, session: Optional[Session] = None) -> Iterator[Session]:
+        """Use the caller's session if given, otherwise a scope of our own."""
+        if session is not None:
+            yield session
+        else:
+            with self.session_scope() as session:
+                yield session
+    
     def create_project(self, name: str, description: str = "", question_text: str = "", 
                       column_to_code: str = "") -> Project:
         """Create a new project."""
@@ -104,15 +388,21 @@ class DatabaseManager:
             session.refresh(project)
             return project
     
-    def get_project(self, name: str) -> Optional[Project]:
-        """Get project by name."""
+    def get_project(self, name: str, session: Optional[Session] = None) -> Optional[Row]:
+        """Get project by name, as a row of the projects table."""
+        with self._session(session) as session:
+            return session.execute(_GET_PROJECT_STMT, {'name': name}).one_or_none()
+    
+    def iter_projects(self, batch_size: int = 100) -> Iterator[Row]:
+        """Iterate over all projects, fetching ``batch_size`` rows at a time."""
         with self.get_session() as session:
-            return session.query(Project).filter(Project.name == name).first()
+            yield from session.execute(
+                select(Project.__table__).execution_options(yield_per=batch_size)
+            )
     
-    def list_projects(self) -> List[Project]:
+    def list_projects(self) -> List[Row]:
         """List all projects."""
-        with self.get_session() as session:
-            return session.query(Project).all()
+        return list(self.iter_projects())
     
     def update_project(self, name: str, **kwargs) -> Optional[Project]:
         """Update project fields."""
@@ -138,31 +428,35 @@ class DatabaseManager:
             return False
     
     def save_codebook(self, project_id: int, codebook_data: dict) -> CodebookVersion:
-        """Save a codebook version for a project."""
-        with self.get_session() as session:
-            # Get the next version number
-            latest_version = session.query(CodebookVersion)\
-                .filter(CodebookVersion.project_id == project_id)\
-                .order_by(CodebookVersion.version.desc()).first()
-            
-            next_version = (latest_version.version + 1) if latest_version else 1
-            
-            codebook = CodebookVersion(
-                project_id=project_id,
-                version=next_version,
-                data=codebook_data
+        """Save a codebook version for a project.
+        
+        The next version number is computed inside the INSERT itself, so
+        concurrent saves cannot pick the same one.
+        """
+        next_version = select(func.coalesce(func.max(CodebookVersion.version), 0) + 1)\
+            .where(CodebookVersion.project_id == project_id)\
+            .scalar_subquery()
+        
+        with self._session() as session:
+            result = session.execute(
+                insert(CodebookVersion).values(
+                    project_id=project_id,
+                    version=next_version,
+                    data=codebook_data,
+                    schema_version=CODEBOOK_SCHEMA_VERSION
+                )
             )
-            session.add(codebook)
-            session.commit()
-            session.refresh(codebook)
-            return codebook
+            # Read back by lastrowid rather than INSERT ... RETURNING, which
+            # needs SQLite 3.35+
+            return session.get(CodebookVersion, result.inserted_primary_key[0])
     
-    def get_latest_codebook(self, project_id: int) -> Optional[CodebookVersion]:
-        """Get the latest codebook version for a project."""
-        with self.get_session() as session:
-            return session.query(CodebookVersion)\
-                .filter(CodebookVersion.project_id == project_id)\
-                .order_by(CodebookVersion.version.desc()).first()
+    def get_latest_codebook(self, project_id: int,
+                            session: Optional[Session] = None) -> Optional[Row]:
+        """Get the latest codebook version for a project, as a row of the codebooks table."""
+        with self._session(session) as session:
+            return session.execute(
+                _GET_LATEST_CODEBOOK_STMT, {'project_id': project_id}
+            ).one_or_none()
     
     def save_classification(self, project_id: int, codebook_id: int, 
                           response_text: str, assigned_codes: List[str], 
@@ -174,6 +468,7 @@ class DatabaseManager:
                 codebook_id=codebook_id,
                 response_text=response_text,
                 assigned_codes=assigned_codes,
+                assigned_codes_display=assigned_codes_display(assigned_codes),
                 details=details
             )
             session.add(classification)
@@ -181,12 +476,76 @@ class DatabaseManager:
             session.refresh(classification)
             return classification
     
-    def get_project_classifications(self, project_id: int) -> List[Classification]:
-        """Get all classifications for a project."""
-        with self.get_session() as session:
-            return session.query(Classification)\
-                .filter(Classification.project_id == project_id)\
-                .order_by(Classification.created_at.desc()).all()
+    def save_classifications_bulk(self, project_id: int, codebook_id: Optional[int],
+                                  results: List[Dict[str, Any]],
+                                  session: Optional[Session] = None) -> int:
+        """Save many classification results in a single transaction.
+        
+        When ``session`` is given, the rows are committed with the caller's
+        transaction instead.
+        
+        Results without a response text are skipped and their indices logged.
+        
+        Returns:
+            Number of rows inserted
+        """
+        now = datetime.utcnow()
+        rows = []
+        skipped = []
+        # One pass: filter, collect skipped indices and build the mappings
+        for index, result in enumerate(results):
+            response_text = result.get('response_text')
+            if not response_text:
+                skipped.append(index)
+                continue
+            assigned_codes = result.get('assigned_codes') or []
+            rows.append({
+                'project_id': project_id,
+                'codebook_id': codebook_id,
+                'response_text': response_text,
+                'assigned_codes': assigned_codes,
+                'assigned_codes_display': assigned_codes_display(assigned_codes),
+                'details': result.get('details') or [],
+                'created_at': now
+            })
+        
+        if skipped:
+            logger.warning(
+                "Skipped %d of %d results with no response text (indices: %s)",
+                len(skipped), len(results), skipped
+            )
+        
+        with self._session(session) as session:
+            session.bulk_insert_mappings(Classification, rows)
+        return len(rows)
+    
+    def get_project_classifications(self, project_id: int) -> List[Row]:
+        """Get all classifications for a project, as rows of the classifications table."""
+        with self._session() as session:
+            return session.execute(
+                _GET_CLASSIFICATIONS_STMT, {'project_id': project_id}
+            ).all()
+    
+    def get_project_classifications_columns(self, project_id: int,
+                                            session: Optional[Session] = None
+                                            ) -> Tuple[list, list, list, list]:
+        """Get classification fields for a project as parallel column lists.
+        
+        Selects only the needed columns, so no ORM objects are built per row.
+        
+        Returns:
+            (response_texts, assigned_codes_displays, details_json, created_ats),
+            newest first; details come back as JSON text, not parsed
+        """
+        with self._session(session) as session:
+            rows = session.execute(
+                _GET_CLASSIFICATION_COLUMNS_STMT, {'project_id': project_id}
+            ).all()
+        
+        if not rows:
+            return [], [], [], []
+        texts, codes, details, created = zip(*rows)
+        return list(texts), list(codes), list(details), list(created)
 
 
 # Global database manager instance
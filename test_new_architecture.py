@@ -119,10 +119,8 @@ def test_basic_functionality():
     # Test 6: Export project data
     print("\\n6. Testing data export...")
     try:
-        export_data = project_manager.export_project_data(project_name, format='json')
         export_path = f"{project_name}_export.json"
-        with open(export_path, 'w') as f:
-            f.write(export_data)
+        project_manager.export_project_data_to_path(project_name, export_path)
         print(f"   ✅ Exported project data to: {export_path}")
     except Exception as e:
         print(f"   ❌ Export failed: {e}")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Storage round-trip checks for the SQLite database layer.
+Covers the custom column types and the upgrade of databases created by
+earlier versions of the app.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+# Add the package to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import event, inspect
+
+from coder_app.storage.database import DatabaseManager
+
+# Schema written by the first release, before the typed columns existed
+LEGACY_SCHEMA = """
+CREATE TABLE projects (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    description TEXT,
+    question_text TEXT,
+    column_to_code VARCHAR(255),
+    created_at DATETIME,
+    last_modified DATETIME
+);
+CREATE TABLE codebooks (
+    id INTEGER NOT NULL PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects (id),
+    version INTEGER NOT NULL,
+    data JSON NOT NULL,
+    created_at DATETIME
+);
+CREATE TABLE classifications (
+    id INTEGER NOT NULL PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects (id),
+    codebook_id INTEGER REFERENCES codebooks (id),
+    response_text TEXT NOT NULL,
+    assigned_codes JSON,
+    details JSON,
+    created_at DATETIME
+);
+"""
+
+LABELS = ["[DK] Don't know", "007", "Price | value"]
+
+
+def _fresh_db(tmp_dir):
+    return DatabaseManager(os.path.join(tmp_dir, "projects.db"))
+
+
+def _legacy_db(tmp_dir, classifications):
+    """Create a database with the legacy schema and the given rows."""
+    db_path = os.path.join(tmp_dir, "legacy.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO projects (id, name) VALUES (1, 'legacy')")
+    conn.executemany(
+        "INSERT INTO classifications (project_id, response_text, assigned_codes, details, created_at)"
+        " VALUES (1, ?, ?, ?, '2024-01-01 00:00:00.000000')",
+        classifications
+    )
+    conn.commit()
+    conn.close()
+    return DatabaseManager(db_path)
+
+
+def _codes_by_text(db, project_id):
+    return {row.response_text: row.assigned_codes for row in db.get_project_classifications(project_id)}
+
+
+def test_assigned_codes_round_trip():
+    """Labels come back exactly as saved, including brackets and digits."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _fresh_db(tmp_dir)
+        project = db.create_project("round-trip")
+        db.save_classifications_bulk(project.id, None, [
+            {'response_text': 'several', 'assigned_codes': LABELS},
+            {'response_text': 'bracketed', 'assigned_codes': ["[Other]"]},
+            {'response_text': 'none', 'assigned_codes': []},
+        ])
+
+        codes = _codes_by_text(db, project.id)
+        assert codes == {'several': LABELS, 'bracketed': ["[Other]"], 'none': []}
+        db.engine.dispose()
+
+
+def test_legacy_assigned_codes_converted():
+    """JSON-stored code lists are converted, and keep their exact labels."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _legacy_db(tmp_dir, [
+            ('several', '["[DK] Don\'t know", "007", "Price | value"]', '[]'),
+            ('empty', '[]', '[]'),
+            ('null', 'null', 'null'),
+        ])
+
+        codes = _codes_by_text(db, 1)
+        assert codes == {'several': LABELS, 'empty': [], 'null': None}
+
+        texts, displays, _, _ = db.get_project_classifications_columns(1)
+        assert dict(zip(texts, displays)) == {
+            'several': " | ".join(LABELS),
+            'empty': "No Code Applied",
+            'null': "No Code Applied",
+        }
+
+        # The table is rebuilt in place with its indexes and other columns
+        inspector = inspect(db.engine)
+        assert 'classifications_new' not in inspector.get_table_names()
+        assert 'ix_classifications_project_created' in {
+            index['name'] for index in inspector.get_indexes('classifications')
+        }
+        details = {row.response_text: row.details for row in db.get_project_classifications(1)}
+        assert details == {'several': [], 'empty': [], 'null': None}
+
+        # New rows in the converted column keep numeric-looking labels as text
+        db.save_classifications_bulk(1, None, [{'response_text': 'new', 'assigned_codes': ["007"]}])
+        assert _codes_by_text(db, 1)['new'] == ["007"]
+        db.engine.dispose()
+
+        # Reopening an already converted database is a no-op
+        reopened = DatabaseManager(db.db_path)
+        assert _codes_by_text(reopened, 1)['several'] == LABELS
+        reopened.engine.dispose()
+
+
+
+def test_codebook_versions_without_returning():
+    """Codebook saves number versions per project, even where SQLite lacks RETURNING."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _fresh_db(tmp_dir)
+        # Behave like SQLite older than 3.35: SQLAlchemy turns RETURNING off
+        # and the database rejects it
+        db.engine.dialect.insert_returning = False
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _reject_returning(conn, cursor, statement, parameters, context, executemany):
+            if 'RETURNING' in statement.upper():
+                raise sqlite3.OperationalError('near "RETURNING": syntax error')
+
+        first = db.create_project("first")
+        second = db.create_project("second")
+
+        versions = [
+            db.save_codebook(first.id, {'codes': []}).version,
+            db.save_codebook(first.id, {'codes': [{'code': 'A'}]}).version,
+            db.save_codebook(second.id, {'codes': []}).version,
+        ]
+        assert versions == [1, 2, 1]
+        assert db.get_latest_codebook(first.id).data == {'codes': [{'code': 'A'}]}
+        db.engine.dispose()
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")